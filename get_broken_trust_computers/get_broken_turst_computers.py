@@ -32,6 +32,7 @@ asyncio https requests.
 import aiohttp
 import asyncio
 import os
+import tempfile
 import time
 import json
 from datetime import datetime, timedelta
@@ -43,6 +44,12 @@ MANAGED_MACS_ADVANCED_SEARCH_ID = # ID number of advanced search
 BROKEN_TRUST_STATIC_GROUP = # ID number of static group to push results to
 MAX_DAYS_SINCE_LAST_COMPLETED_MANAGEMENT_COMMAND = 15
 
+# The advanced search results are kept here with their ETag/Last-Modified
+# headers so the next run can ask JAMF for them with a conditional request
+ADVANCED_SEARCH_CACHE = os.path.join(
+    os.path.expanduser("~"), ".get_broken_trust_computers_cache.json"
+)
+
 # Enable or disable SSL verification for JAMF if you are having issues
 SSL_VERIFICATION = True
 
@@ -69,10 +76,25 @@ async def get_auth_token():
 
 async def get_all_managed_macs(aiohttp_session):
     """Get managed Mac IDs from an advanced search set up with desired last checkin time"""
-    r = await aiohttp_session.get(
-        f"{JAMF_API_URL}/JSSResource/advancedcomputersearches/id/{MANAGED_MACS_ADVANCED_SEARCH_ID}",
-    )
-    raw_json = await r.text()
+    url = f"{JAMF_API_URL}/JSSResource/advancedcomputersearches/id/{MANAGED_MACS_ADVANCED_SEARCH_ID}"
+    cached = read_advanced_search_cache(url)
+    # Only ever reuse the cached results when JAMF confirms they haven't
+    # changed, there is no time based fallback
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+    r = await aiohttp_session.get(url, headers=headers)
+    if r.status == 304 and cached:
+        print("Advanced search results not modified, using cached copy")
+        raw_json = cached["body"]
+    else:
+        raw_json = await r.text()
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        if r.status == 200 and (etag or last_modified):
+            write_advanced_search_cache(url, etag, last_modified, raw_json)
     computers = json.loads(raw_json)
     return [
         {"name": computer["name"], "id": computer["id"]}
@@ -80,6 +102,27 @@ async def get_all_managed_macs(aiohttp_session):
     ]
 
 
+def read_advanced_search_cache(url):
+    """Return the cached advanced search response for url, if there is one"""
+    try:
+        with open(ADVANCED_SEARCH_CACHE) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if cached.get("url") == url else None
+
+
+def write_advanced_search_cache(url, etag, last_modified, body):
+    """Save an advanced search response, replacing the cache file atomically"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(ADVANCED_SEARCH_CACHE))
+    with os.fdopen(fd, "w") as f:
+        json.dump(
+            {"url": url, "etag": etag, "last_modified": last_modified, "body": body},
+            f,
+        )
+    os.replace(tmp_path, ADVANCED_SEARCH_CACHE)
+
+
 async def process_managed_command_history(aiohttp_session, computers):
     """Processes computers managed command history and return those that meet our criteria for broken trust"""
     # Set the global COMPUTER_COUNT variable to the total number of computers so
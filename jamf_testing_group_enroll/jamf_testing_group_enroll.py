@@ -15,17 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function
-import Tkinter as tk
-import tkMessageBox as tm
-from Cocoa import NSRunningApplication, NSApplicationActivateIgnoringOtherApps
-from Foundation import NSBundle
 import argparse
 import os
-import httplib
 import json
 import base64
+import errno
 import sys
-import subprocess
+import re
+import stat
+import tempfile
+import threading
+import time
 
 """
 Reads from an extension attribute in Jamf Pro with a list of testing group options, creates a Tkinter window,
@@ -33,6 +33,132 @@ and allows the user to choose a testing group and it writes that data back to th
 Intended to be run via Self Service.
 """
 
+# Popup choices are cached locally so the window can be shown before the Jamf Pro server answers. The cache is only
+# used if CACHE_DIR is a directory that no one but the user running the script can access
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'jamf_testing_group_enroll')
+CACHE_TTL = 3600
+# How often (in milliseconds) the Tk main loop checks on the background lookups
+POLL_INTERVAL = 100
+
+# The GUI modules are slow to import, so they are only loaded by import_gui_modules once a window is actually needed
+tk = None
+tm = None
+NSRunningApplication = None
+NSApplicationActivateIgnoringOtherApps = None
+NSBundle = None
+# Likewise only loaded, by import_lookup_modules, once there is something to look up
+httplib = None
+subprocess = None
+
+
+def import_gui_modules():
+    """
+    Import Tkinter and the PyObjC bridges into the module namespace. Argument parsing (and --help) never needs them.
+    """
+    global tk, tm, NSRunningApplication, NSApplicationActivateIgnoringOtherApps, NSBundle
+    import Tkinter as tk
+    import tkMessageBox as tm
+    from Cocoa import NSRunningApplication, NSApplicationActivateIgnoringOtherApps
+    from Foundation import NSBundle
+
+
+def import_lookup_modules():
+    """
+    Import httplib and subprocess into the module namespace. Python 2 imports all share one lock, even for modules
+    that are already loaded, so this runs on the main thread before the lookup threads start rather than having them
+    wait on the GUI imports.
+    """
+    global httplib, subprocess
+    if httplib is None:
+        import httplib
+        import subprocess
+
+
+class TestingGroupLookups:
+    """
+    Looks up the serial number and refreshes the extension attribute on background threads, starting from the cached
+    extension attribute if there is one. Nothing here touches Tk, so it can be run headlessly.
+    """
+    def __init__(self, server, auth, ea_id, serial_number_lookup=None):
+        self.server = server
+        self.auth = auth
+        self.id = ea_id
+        self.serial_number_lookup = serial_number_lookup or get_serial_number
+        self.serial_number = None
+        self.extension_attribute = None
+        self.extension_attribute_name = None
+        self.testing_groups = []
+        self.results = {}
+        self.threads = []
+        cached_extension_attribute = read_cached_extension_attribute(self.server, self.id)
+        if cached_extension_attribute:
+            self.load_extension_attribute(cached_extension_attribute)
+
+    def start(self):
+        import_lookup_modules()
+        self.threads = [
+            threading.Thread(target=self.run_lookup, args=('serial_number', self.serial_number_lookup)),
+            threading.Thread(target=self.run_lookup, args=('extension_attribute', self.get_extension_attribute)),
+        ]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def run_lookup(self, name, lookup):
+        """
+        Run a lookup on a background thread and store its result (or the exception it raised) for poll.
+        """
+        try:
+            self.results[name] = (lookup(), None)
+        except Exception as e:
+            self.results[name] = (None, e)
+
+    def get_extension_attribute(self):
+        # Revalidate even an expired cache entry, a 304 from the server is still cheaper than the full response
+        extension_attribute, etag, last_modified = get_extension_attribute(self.server, self.auth, self.id,
+                                                                           read_cache_entry(self.server, self.id))
+        # Rewriting the cache also restarts its TTL
+        write_cached_extension_attribute(self.server, self.id, extension_attribute, etag, last_modified)
+        return extension_attribute
+
+    def load_extension_attribute(self, extension_attribute):
+        self.extension_attribute = extension_attribute
+        self.extension_attribute_name = extension_attribute['computer_extension_attribute']['name']
+        self.testing_groups = [choice for choice in
+                               extension_attribute['computer_extension_attribute']['input_type']['popup_choices']]
+
+    def poll(self):
+        """
+        Apply the lookups that have finished. Returns (error, testing_groups_changed), where error is a message if a
+        lookup failed in a way the window can't carry on from.
+        """
+        testing_groups_changed = False
+        if 'serial_number' in self.results and self.serial_number is None:
+            serial_number, error = self.results['serial_number']
+            if error:
+                return "Couldn't find serial number: {}".format(error), testing_groups_changed
+            self.serial_number = serial_number
+        if 'extension_attribute' in self.results:
+            extension_attribute, error = self.results.pop('extension_attribute')
+            # A failed refresh is fine as long as there are cached testing groups to choose from
+            if error and not self.testing_groups:
+                return "Couldn't get testing groups: {}".format(error), testing_groups_changed
+            if extension_attribute and extension_attribute != self.extension_attribute:
+                self.load_extension_attribute(extension_attribute)
+                testing_groups_changed = True
+        return None, testing_groups_changed
+
+    def ready(self):
+        """
+        Return whether there is enough to set the extension attribute: the serial number and the (possibly cached)
+        extension attribute. The refresh may still be running.
+        """
+        return bool(self.serial_number and self.extension_attribute_name)
+
+    def finished(self):
+        return not (any(thread.is_alive() for thread in self.threads) or self.serial_number is None
+                    or 'extension_attribute' in self.results)
+
 
 class EntryWindow:
     def __init__(self, args):
@@ -40,12 +166,13 @@ class EntryWindow:
         self.user = args.user
         self.password = args.password
         self.id = args.id
-        self.auth = self.get_authorization_header()
-        self.serial_number = self.get_serial_number()
-        self.extension_attribute = self.get_extension_attribute()
-        self.extension_attribute_name = self.extension_attribute['computer_extension_attribute']['name']
-        self.testing_groups = [choice for choice in
-                               self.extension_attribute['computer_extension_attribute']['input_type']['popup_choices']]
+        self.auth = get_authorization_header(self.user, self.password)
+        # Look up the serial number and fetch the extension attribute in the background so the window shows up right
+        # away; the results are picked up on the Tk thread by poll_lookups. They are started before the GUI modules
+        # are imported so the lookups overlap with those slow imports too
+        self.lookups = TestingGroupLookups(self.server, self.auth, self.id)
+        self.lookups.start()
+        import_gui_modules()
         self.root = tk.Tk()
         self.root.attributes("-topmost", True)
         self.root.title("Choose Testing Group")
@@ -53,13 +180,13 @@ class EntryWindow:
         self.testing_groups_var.set(None)
         self.l1 = tk.Label(self.root, text="Testing Groups:", padx=10, pady=5).grid(row=0)
         # self.e1 = tk.Entry(self.root, width=25)
-        self.e1 = tk.OptionMenu(self.root, self.testing_groups_var, *self.testing_groups)
+        self.e1 = tk.OptionMenu(self.root, self.testing_groups_var, *(self.lookups.testing_groups or ["Loading..."]))
 
         self.e1.grid(row=0, column=1, padx=10, sticky=tk.E)
 
-        tk.Button(self.root, text="Continue", command=self.set_extension_attribute).grid(row=4, column=1, padx=4,
-                                                                                         pady=4,
-                                                                                         sticky=tk.E)
+        self.continue_button = tk.Button(self.root, text="Continue", command=self.set_extension_attribute,
+                                         state=tk.DISABLED)
+        self.continue_button.grid(row=4, column=1, padx=4, pady=4, sticky=tk.E)
         self.center()
         self.app = NSRunningApplication.runningApplicationWithProcessIdentifier_(os.getpid())
         self.app.activateWithOptions_(NSApplicationActivateIgnoringOtherApps)
@@ -68,8 +195,33 @@ class EntryWindow:
             self.info = self.bundle.localizedInfoDictionary() or self.bundle.infoDictionary()
             if self.info and self.info['CFBundleName'] == 'Python':
                 self.info['CFBundleName'] = "Testing Group Enrollment"
+        self.root.after(POLL_INTERVAL, self.poll_lookups)
         self.root.mainloop()
 
+    def poll_lookups(self):
+        """
+        Apply finished background lookups to the window. Tkinter is not thread safe so this runs on the Tk thread.
+        """
+        error, testing_groups_changed = self.lookups.poll()
+        if error:
+            self.show_message(title="Failure!", message=error, icon=tm.WARNING)
+            self.root.destroy()
+            return
+        if testing_groups_changed:
+            self.update_testing_groups_menu()
+        if self.lookups.ready():
+            self.continue_button.config(state=tk.NORMAL)
+        if not self.lookups.finished():
+            self.root.after(POLL_INTERVAL, self.poll_lookups)
+
+    def update_testing_groups_menu(self):
+        menu = self.e1['menu']
+        menu.delete(0, tk.END)
+        for choice in self.lookups.testing_groups:
+            menu.add_command(label=choice, command=tk._setit(self.testing_groups_var, choice))
+        if self.testing_groups_var.get() not in self.lookups.testing_groups:
+            self.testing_groups_var.set(None)
+
     def center(self):
         self.root.update_idletasks()
         w = self.root.winfo_screenwidth()
@@ -79,30 +231,6 @@ class EntryWindow:
         y = h / 2 - size[1] / 2
         self.root.geometry("%dx%d+%d+%d" % (size + (x, y)))
 
-    @staticmethod
-    def get_serial_number():
-        import plistlib
-        cmd = ['system_profiler', 'SPHardwareDataType', '-xml']
-        return plistlib.readPlistFromString(subprocess.check_output(cmd))[0]['_items'][0]['serial_number']
-
-    def get_authorization_header(self):
-        auth = base64.b64encode("{}:{}".format(self.user, self.password))
-        return "Basic {}".format(auth)
-
-    def get_extension_attribute(self):
-        request = httplib.HTTPSConnection(self.server)
-        headers = {
-            'Authorization': self.auth, 'Accept': 'application/json'
-        }
-        try:
-            request.request("GET", "/JSSResource/computerextensionattributes/id/{}".format(self.id), headers=headers)
-            response = request.getresponse()
-            json_data = json.loads(response.read())
-            return json_data
-        except httplib.HTTPException as e:
-            print("Exception: %s" % e)
-            sys.exist(1)
-
     def set_extension_attribute(self):
         choice = self.testing_groups_var.get()
         xml = """
@@ -114,13 +242,14 @@ class EntryWindow:
                 </attribute>
             </extension_attributes>
         </computer>
-            """.format(self.extension_attribute_name, choice)
-        request = httplib.HTTPSConnection(self.server)
+            """.format(self.lookups.extension_attribute_name, choice)
+        request = get_connection(self.server)
         headers = {
             'Authorization': self.auth, 'Content-type': 'application/xml'
         }
+        import_lookup_modules()
         try:
-            request.request("PUT", "/JSSResource/computers/serialnumber/{}".format(self.serial_number), xml,
+            request.request("PUT", "/JSSResource/computers/serialnumber/{}".format(self.lookups.serial_number), xml,
                             headers=headers)
             response = request.getresponse()
             if response.status == 201:
@@ -137,8 +266,133 @@ class EntryWindow:
             print("Exception: %s" % e)
             sys.exit(1)
 
-    def show_message(self, title="", message="", icon=tm.INFO):
-        tm.showinfo(title=title, message=message, icon=icon)
+    def show_message(self, title="", message="", icon=None):
+        tm.showinfo(title=title, message=message, icon=icon or tm.INFO)
+
+
+def get_serial_number():
+    """
+    Read the serial number from the IORegistry, which is much quicker than a full system_profiler hardware report.
+    """
+    import_lookup_modules()
+    cmd = ['ioreg', '-c', 'IOPlatformExpertDevice', '-d', '2']
+    match = re.search(r'"IOPlatformSerialNumber" = "([^"]+)"', subprocess.check_output(cmd))
+    if not match:
+        raise ValueError("IOPlatformSerialNumber not found in ioreg output")
+    return match.group(1)
+
+
+def get_authorization_header(user, password):
+    auth = base64.b64encode("{}:{}".format(user, password))
+    return "Basic {}".format(auth)
+
+
+def get_connection(server):
+    """
+    Return a connection to the Jamf Pro server. A server given as http://host:port (e.g. a local stand-in server
+    used for testing) gets a plain HTTP connection, anything else is treated as an HTTPS host.
+    """
+    import_lookup_modules()
+    if server.startswith('http://'):
+        return httplib.HTTPConnection(server[len('http://'):].rstrip('/'))
+    if server.startswith('https://'):
+        server = server[len('https://'):].rstrip('/')
+    return httplib.HTTPSConnection(server)
+
+
+def get_extension_attribute(server, auth, ea_id, cached=None):
+    """
+    Fetch an extension attribute, returning it with its ETag and Last-Modified headers. If a cache entry is given the
+    request is made conditional on it, and the cached extension attribute is returned if it hasn't changed.
+    """
+    import_lookup_modules()
+    request = get_connection(server)
+    headers = {
+        'Authorization': auth, 'Accept': 'application/json'
+    }
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached['last_modified']:
+        headers['If-Modified-Since'] = cached['last_modified']
+    request.request("GET", "/JSSResource/computerextensionattributes/id/{}".format(ea_id), headers=headers)
+    response = request.getresponse()
+    if response.status == 304 and cached:
+        return cached['extension_attribute'], cached['etag'], cached['last_modified']
+    if response.status != 200:
+        raise httplib.HTTPException("Unexpected response status {}".format(response.status))
+    return json.loads(response.read()), response.getheader('ETag'), response.getheader('Last-Modified')
+
+
+def is_private(path_stat):
+    """
+    Return whether a file or directory is owned by the current user and no one else has any access to it.
+    """
+    return path_stat.st_uid == os.getuid() and not path_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+
+
+def get_cache_path(server, ea_id):
+    """
+    Return the cache file path for an extension attribute, or None if CACHE_DIR can't be trusted. Self Service runs
+    this as root, so a cache file planted by another user would otherwise end up being sent to Jamf Pro.
+    """
+    try:
+        os.makedirs(CACHE_DIR, 0700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            return None
+    cache_dir_stat = os.lstat(CACHE_DIR)
+    if not (stat.S_ISDIR(cache_dir_stat.st_mode) and is_private(cache_dir_stat)):
+        print("Not using cache {}, it isn't a directory only this user can access".format(CACHE_DIR))
+        return None
+    name = re.sub(r'[^A-Za-z0-9.-]', '_', "{}_{}".format(server, ea_id))
+    return os.path.join(CACHE_DIR, "jamf_testing_group_enroll_{}.json".format(name))
+
+
+def read_cache_entry(server, ea_id, ttl=None):
+    """
+    Return the cache entry (the extension attribute with its ETag and Last-Modified headers) if there is one younger
+    than ttl seconds, or of any age if ttl is None. Otherwise return None.
+    """
+    path = get_cache_path(server, ea_id)
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            cache_stat = os.fstat(f.fileno())
+            # Only trust cache files written by write_cached_extension_attribute, which creates them 0600
+            if not is_private(cache_stat):
+                return None
+            if ttl is not None and time.time() - cache_stat.st_mtime > ttl:
+                return None
+            entry = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or 'extension_attribute' not in entry:
+        return None
+    return entry
+
+
+def read_cached_extension_attribute(server, ea_id, ttl=CACHE_TTL):
+    """
+    Return the cached extension attribute if it is younger than ttl seconds, otherwise None.
+    """
+    entry = read_cache_entry(server, ea_id, ttl)
+    return entry and entry['extension_attribute']
+
+
+def write_cached_extension_attribute(server, ea_id, extension_attribute, etag=None, last_modified=None):
+    path = get_cache_path(server, ea_id)
+    if not path:
+        return
+    entry = {'extension_attribute': extension_attribute, 'etag': etag, 'last_modified': last_modified}
+    # Write to a temporary file and rename it so a concurrent reader never sees a partial cache file
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        print("Couldn't write cache: %s" % e)
 
 
 def arguments():
@@ -149,7 +403,7 @@ def arguments():
     parser.add_argument('--id', help='id of extension attribute to pull list of testing groups from', type=int,
                         required=True)
 
-    all_options = ['-s', '-u', '-p', '--server', '--user', '--password', '--id']
+    all_options = ['-h', '-s', '-u', '-p', '--help', '--server', '--user', '--password', '--id']
 
     # Test if options are being passed from the command line with flags or if they are positional arguments supplied by JSS
     if any((True for option in all_options if option in sys.argv)):
@@ -0,0 +1,184 @@
+"""
+Tests for jamf_testing_group_enroll that run without a display or PyObjC, against a local stand-in Jamf Pro server.
+Run from this folder with: python -m unittest test_jamf_testing_group_enroll
+"""
+
+import BaseHTTPServer
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import jamf_testing_group_enroll
+
+# Modules that make startup slow and must not be loaded just to parse arguments or show --help
+SLOW_MODULES = ['Tkinter', 'tkMessageBox', 'Cocoa', 'Foundation', 'objc', 'httplib', 'ssl', 'socket', 'subprocess']
+# Generous upper bound (in seconds) on importing the script and parsing --help, to catch slow imports creeping back
+IMPORT_TIME_BUDGET = 0.5
+
+# Runs in a fresh interpreter so modules loaded by the test runner don't count
+STARTUP_CHECK = """
+import json, sys, time
+start = time.time()
+import jamf_testing_group_enroll
+sys.argv = ['jamf_testing_group_enroll.py', '--help']
+sys.stdout = open('/dev/null', 'w')
+try:
+    jamf_testing_group_enroll.arguments()
+except SystemExit:
+    pass
+elapsed = time.time() - start
+sys.stderr.write(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+class StartupTest(unittest.TestCase):
+    def test_help_does_not_load_gui_or_network_modules(self):
+        process = subprocess.Popen([sys.executable, '-c', STARTUP_CHECK], cwd=HERE, stderr=subprocess.PIPE)
+        result = json.loads(process.communicate()[1])
+        self.assertEqual([module for module in SLOW_MODULES if module in result['modules']], [])
+        self.assertLess(result['seconds'], IMPORT_TIME_BUDGET)
+
+
+def extension_attribute(*choices):
+    return {'computer_extension_attribute': {'name': 'Testing Group', 'input_type': {'popup_choices': list(choices)}}}
+
+
+class StandInJamfPro(BaseHTTPServer.BaseHTTPRequestHandler):
+    extension_attribute = None
+    etag = None
+    status = 200
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.status != 200:
+            self.send_response(self.status)
+            self.end_headers()
+            return
+        if self.etag and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(self.extension_attribute)
+        self.send_response(200)
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInJamfPro)
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StandInJamfPro.extension_attribute = extension_attribute('Alpha', 'Beta')
+        StandInJamfPro.etag = '"1"'
+        StandInJamfPro.status = 200
+        del StandInJamfPro.requests[:]
+        self.directory = tempfile.mkdtemp()
+        self.original_cache_dir = jamf_testing_group_enroll.CACHE_DIR
+        jamf_testing_group_enroll.CACHE_DIR = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        jamf_testing_group_enroll.CACHE_DIR = self.original_cache_dir
+        shutil.rmtree(self.directory)
+
+
+class GetExtensionAttributeTest(StandInServerTestCase):
+    def test_returns_extension_attribute_and_validators(self):
+        result = jamf_testing_group_enroll.get_extension_attribute(self.url, 'Basic x', 3)
+        self.assertEqual(result, (extension_attribute('Alpha', 'Beta'), '"1"', None))
+        self.assertEqual(StandInJamfPro.requests, [('/JSSResource/computerextensionattributes/id/3', None)])
+
+    def test_not_modified_returns_cached_extension_attribute(self):
+        cached = {'extension_attribute': extension_attribute('Cached'), 'etag': '"1"', 'last_modified': None}
+        result = jamf_testing_group_enroll.get_extension_attribute(self.url, 'Basic x', 3, cached)
+        self.assertEqual(result, (extension_attribute('Cached'), '"1"', None))
+        self.assertEqual(StandInJamfPro.requests[-1][1], '"1"')
+
+    def test_modified_returns_new_extension_attribute(self):
+        cached = {'extension_attribute': extension_attribute('Cached'), 'etag': '"0"', 'last_modified': None}
+        result = jamf_testing_group_enroll.get_extension_attribute(self.url, 'Basic x', 3, cached)
+        self.assertEqual(result, (extension_attribute('Alpha', 'Beta'), '"1"', None))
+
+
+class TestingGroupLookupsTest(StandInServerTestCase):
+    def run_lookups(self):
+        lookups = jamf_testing_group_enroll.TestingGroupLookups(self.url, 'Basic x', 3,
+                                                                serial_number_lookup=lambda: 'C02TEST')
+        testing_groups_before_start = list(lookups.testing_groups)
+        lookups.start()
+        for thread in lookups.threads:
+            thread.join()
+        return lookups, testing_groups_before_start, lookups.poll()
+
+    def test_first_run_fetches_and_caches(self):
+        lookups, testing_groups_before_start, poll_result = self.run_lookups()
+        self.assertEqual(testing_groups_before_start, [])
+        self.assertEqual(poll_result, (None, True))
+        self.assertEqual(lookups.serial_number, 'C02TEST')
+        self.assertEqual(lookups.testing_groups, ['Alpha', 'Beta'])
+        self.assertTrue(lookups.ready())
+        self.assertTrue(lookups.finished())
+
+    def test_cached_choices_are_available_before_refresh_and_revalidated(self):
+        self.run_lookups()
+        lookups, testing_groups_before_start, poll_result = self.run_lookups()
+        self.assertEqual(testing_groups_before_start, ['Alpha', 'Beta'])
+        self.assertEqual(poll_result, (None, False))
+        self.assertEqual(StandInJamfPro.requests[-1][1], '"1"')
+
+    def test_failed_refresh_falls_back_to_cache(self):
+        self.run_lookups()
+        StandInJamfPro.status = 500
+        lookups, _, poll_result = self.run_lookups()
+        self.assertEqual(poll_result, (None, False))
+        self.assertTrue(lookups.ready())
+
+    def test_failed_fetch_without_cache_is_an_error(self):
+        StandInJamfPro.status = 500
+        lookups, _, (error, _) = self.run_lookups()
+        self.assertTrue(error.startswith("Couldn't get testing groups"))
+        self.assertFalse(lookups.ready())
+
+
+class CacheTest(StandInServerTestCase):
+    def test_refuses_cache_file_others_can_access(self):
+        jamf_testing_group_enroll.write_cached_extension_attribute(self.url, 3, extension_attribute('Alpha'))
+        self.assertEqual(jamf_testing_group_enroll.read_cached_extension_attribute(self.url, 3),
+                         extension_attribute('Alpha'))
+        os.chmod(jamf_testing_group_enroll.get_cache_path(self.url, 3), 0644)
+        self.assertIsNone(jamf_testing_group_enroll.read_cached_extension_attribute(self.url, 3))
+
+    def test_refuses_cache_directory_others_can_access(self):
+        os.mkdir(jamf_testing_group_enroll.CACHE_DIR)
+        os.chmod(jamf_testing_group_enroll.CACHE_DIR, 0777)
+        self.assertIsNone(jamf_testing_group_enroll.get_cache_path(self.url, 3))
+        jamf_testing_group_enroll.write_cached_extension_attribute(self.url, 3, extension_attribute('Alpha'))
+        self.assertEqual(os.listdir(jamf_testing_group_enroll.CACHE_DIR), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# Copyright (C) 2015 Christopher Collins
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+SQLite full text index of the scripts, extension attributes and configuration profiles written by the JSS download
+scripts. The download scripts add to it as they export and jss_search_export_index searches it.
+"""
+
+import os
+import sqlite3
+
+INDEX_NAME = 'jss_export_index.sqlite'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS objects (
+        rowid INTEGER PRIMARY KEY,
+        object_type TEXT NOT NULL,
+        object_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        path TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        UNIQUE (object_type, object_id)
+    );
+    CREATE TABLE IF NOT EXISTS payload_identifiers (
+        object_rowid INTEGER NOT NULL REFERENCES objects (rowid),
+        identifier TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS payload_identifiers_identifier ON payload_identifiers (identifier);
+    CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts4 (name, content);
+"""
+
+
+def get_index_path(write_path):
+    """
+    Return the path of the index the download scripts keep in their write path.
+    """
+    return os.path.join(write_path, INDEX_NAME)
+
+
+def open_index(index_path):
+    """
+    Open (creating it if needed) the index at index_path.
+    """
+    index = sqlite3.connect(index_path)
+    index.executescript(SCHEMA)
+    return index
+
+
+def index_file(index, object_type, object_id, name, path, content_hash, payload_identifiers=()):
+    """
+    Add or update an exported file in the index. The file is only read and its full text re-indexed if its content
+    hash changed since the last export.
+    """
+    row = index.execute("SELECT rowid, name, content_hash FROM objects WHERE object_type = ? AND object_id = ?",
+                        (object_type, int(object_id))).fetchone()
+    if row and row[2] == content_hash:
+        index.execute("UPDATE objects SET name = ?, path = ? WHERE rowid = ?", (name, path, row[0]))
+        if row[1] != name:
+            index.execute("UPDATE contents SET name = ? WHERE docid = ?", (name, row[0]))
+        return
+    with open(path) as f:
+        content = f.read().decode('utf-8', 'replace')
+    if row:
+        rowid = row[0]
+        index.execute("UPDATE objects SET name = ?, path = ?, content_hash = ? WHERE rowid = ?",
+                      (name, path, content_hash, rowid))
+        index.execute("DELETE FROM contents WHERE docid = ?", (rowid,))
+        index.execute("DELETE FROM payload_identifiers WHERE object_rowid = ?", (rowid,))
+    else:
+        rowid = index.execute("INSERT INTO objects (object_type, object_id, name, path, content_hash) "
+                              "VALUES (?, ?, ?, ?, ?)",
+                              (object_type, int(object_id), name, path, content_hash)).lastrowid
+    index.execute("INSERT INTO contents (docid, name, content) VALUES (?, ?, ?)", (rowid, name, content))
+    index.executemany("INSERT INTO payload_identifiers (object_rowid, identifier) VALUES (?, ?)",
+                      ((rowid, identifier) for identifier in payload_identifiers))
+
+
+def prune_index(index, object_type, object_ids):
+    """
+    Remove every object of object_type whose id isn't in object_ids, i.e. objects deleted from the JSS since they were
+    last exported. Only call this after a complete export of that type.
+    """
+    object_ids = set(int(object_id) for object_id in object_ids)
+    stale = [rowid for rowid, object_id in
+             index.execute("SELECT rowid, object_id FROM objects WHERE object_type = ?", (object_type,))
+             if object_id not in object_ids]
+    for rowid in stale:
+        index.execute("DELETE FROM contents WHERE docid = ?", (rowid,))
+        index.execute("DELETE FROM payload_identifiers WHERE object_rowid = ?", (rowid,))
+        index.execute("DELETE FROM objects WHERE rowid = ?", (rowid,))
+
+
+def update_index(index_path, object_type, written):
+    """
+    Index a complete export of object_type, given as (object_id, name, path, content_hash[, payload_identifiers])
+    tuples, and drop objects of that type that weren't part of it. Runs as a single short transaction.
+    """
+    index = open_index(index_path)
+    try:
+        with index:
+            for entry in written:
+                index_file(index, object_type, *entry)
+            prune_index(index, object_type, [entry[0] for entry in written])
+    finally:
+        index.close()
+
+
+def get_payload_identifiers(profile):
+    """
+    Return the PayloadIdentifier of a parsed configuration profile and of each payload in its PayloadContent.
+    """
+    if not isinstance(profile, dict):
+        return []
+    payloads = [profile] + [payload for payload in profile.get('PayloadContent') or [] if isinstance(payload, dict)]
+    return [payload['PayloadIdentifier'] for payload in payloads if payload.get('PayloadIdentifier')]
+
+
+def search(index, query=None, object_type=None, payload_identifier=None):
+    """
+    Return (object_type, object_id, name, path) for every indexed object matching all of the given criteria. query
+    uses SQLite full text search syntax, e.g. '"/usr/local/bin"' or 'jamf AND recon'.
+    """
+    clauses = []
+    params = []
+    if query:
+        clauses.append("rowid IN (SELECT docid FROM contents WHERE contents MATCH ?)")
+        params.append(query)
+    if object_type:
+        clauses.append("object_type = ?")
+        params.append(object_type)
+    if payload_identifier:
+        clauses.append("rowid IN (SELECT object_rowid FROM payload_identifiers WHERE identifier = ?)")
+        params.append(payload_identifier)
+    sql = "SELECT object_type, object_id, name, path FROM objects"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return index.execute(sql + " ORDER BY object_type, name", params).fetchall()
@@ -0,0 +1,49 @@
+# Copyright (C) 2015 Christopher Collins
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Pool of processes the JSS download scripts hand payloads to for decoding and writing, so large payloads don't hold up
+fetching the next ones.
+"""
+
+import collections
+import multiprocessing
+
+
+def write_in_pool(items, worker, processes=None):
+    """
+    Run worker(*args) in a pool of processes for each (context, args) in items, yielding (context, result) in the
+    order items came in. items is consumed lazily, so it can fetch each payload as it goes. Once more than twice as many
+    payloads as there are processes are queued, it waits on the oldest one so fetching can't run ahead of the pool and
+    hold the whole export in memory. processes defaults to one per CPU core. An exception raised by worker is raised
+    here, and the pool is terminated however the iteration ends.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+    pending = collections.deque()
+    try:
+        for context, args in items:
+            pending.append((context, pool.apply_async(worker, args)))
+            while pending and (pending[0][1].ready() or len(pending) > processes * 2):
+                context, result = pending.popleft()
+                yield context, result.get()
+        pool.close()
+        while pending:
+            context, result = pending.popleft()
+            yield context, result.get()
+    finally:
+        pool.terminate()
+        pool.join()
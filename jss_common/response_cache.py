@@ -0,0 +1,186 @@
+# Copyright (C) 2015 Christopher Collins
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+On disk cache of JSS GET responses shared by the JSS download scripts. Responses the JSS sent an ETag or Last-Modified
+header with are revalidated with a conditional request, others are reused without a request until they expire, and
+the least recently used responses are evicted once the cache grows too big.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import time
+import urllib2
+
+
+class ResponseCache:
+    def __init__(self, path, ttl, max_size):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+        self.usable = None
+
+    def is_usable(self):
+        """
+        Check (once) that the cache directory is ours and private, creating it if needed. Anyone else who can write to
+        it could plant responses that would be exported as if they came from the JSS, so the cache is bypassed if not.
+        """
+        if self.usable is None:
+            self.usable = is_private_directory(self.path)
+            if not self.usable:
+                print "Not using response cache {}, it isn't a directory only this user can access".format(self.path)
+        return self.usable
+
+    def read(self, jss_request):
+        """
+        Return the body of a JSS GET request, or None if it didn't come back with a 200.
+        """
+        entry_path = None
+        metadata = None
+        if self.is_usable():
+            key = hashlib.sha1(jss_request.get_header('Authorization', '') + jss_request.get_full_url()).hexdigest()
+            entry_path = os.path.join(self.path, key)
+            metadata = read_entry_metadata(entry_path)
+        if metadata and (metadata['etag'] or metadata['last_modified']):
+            if metadata['etag']:
+                jss_request.add_header('If-None-Match', metadata['etag'])
+            if metadata['last_modified']:
+                jss_request.add_header('If-Modified-Since', metadata['last_modified'])
+            try:
+                return self.store(entry_path, urllib2.urlopen(jss_request))
+            except urllib2.HTTPError as e:
+                if e.code != 304:
+                    raise
+            body = self.read_entry_body(entry_path)
+            if body is not None:
+                self.stats['revalidated'] += 1
+                return body
+            # The entry was evicted (e.g. by another download script sharing the cache) after it was read, so the 304
+            # can't be used; ask for the whole response instead
+            for header in ('If-None-Match', 'If-Modified-Since'):
+                jss_request.headers.pop(header.capitalize(), None)
+        elif metadata and time.time() - metadata['stored'] < self.ttl:
+            body = self.read_entry_body(entry_path)
+            if body is not None:
+                self.stats['hits'] += 1
+                return body
+        return self.store(entry_path, urllib2.urlopen(jss_request))
+
+    def store(self, entry_path, request_response):
+        """
+        Count a cache miss and return the body of a fresh response, caching it if it came back with a 200.
+        """
+        self.stats['misses'] += 1
+        if request_response.code != 200:
+            return None
+        body = request_response.read()
+        if entry_path:
+            write_entry(entry_path, body, {
+                'etag': request_response.info().getheader('ETag'),
+                'last_modified': request_response.info().getheader('Last-Modified'),
+                'stored': time.time(),
+            })
+        return body
+
+    def read_entry_body(self, entry_path):
+        """
+        Return the body of a cache entry, or None if it has gone since its metadata was read.
+        """
+        try:
+            # Touch the entry so evict treats it as recently used
+            os.utime(entry_path, None)
+            with open(entry_path) as f:
+                f.readline()
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def evict(self):
+        """
+        Remove the least recently used responses until the cache is no bigger than max_size bytes. The download
+        scripts share a cache and may evict at the same time, so entries that disappear meanwhile are skipped.
+        """
+        if not self.is_usable():
+            return
+        entries = []
+        for name in os.listdir(self.path):
+            # Skip entries that are still being written
+            if not name.startswith('.'):
+                entry_path = os.path.join(self.path, name)
+                try:
+                    entry_stat = os.stat(entry_path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    continue
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            total_size -= size
+
+
+def is_private_directory(path):
+    """
+    Create path if it doesn't exist, and return whether it is a real directory owned by the current user that no one
+    else has any access to.
+    """
+    try:
+        os.makedirs(path, 0700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            return False
+    path_stat = os.lstat(path)
+    return (stat.S_ISDIR(path_stat.st_mode) and path_stat.st_uid == os.getuid()
+            and not path_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO))
+
+
+def read_entry_metadata(entry_path):
+    """
+    Return the metadata stored on the first line of a cache entry, or None if there is no usable entry.
+    """
+    try:
+        with open(entry_path) as f:
+            return json.loads(f.readline())
+    except (IOError, ValueError):
+        return None
+
+
+def write_entry(entry_path, body, metadata):
+    """
+    Write a cache entry (its metadata as a line of JSON followed by the body) to a temporary file and rename it into
+    place, so a reader never sees a partial entry.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), prefix='.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(metadata) + '\n')
+            f.write(body)
+        os.rename(tmp_path, entry_path)
+    except:
+        os.remove(tmp_path)
+        raise
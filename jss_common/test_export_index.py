@@ -0,0 +1,117 @@
+"""
+Tests for export_index. Run with: python -m unittest discover -s jss_common
+"""
+
+import os
+import plistlib
+import shutil
+import tempfile
+import unittest
+
+from jss_common import export_index
+
+MOBILECONFIG = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+    <key>PayloadContent</key>
+    <array>
+        <dict>
+            <key>PayloadIdentifier</key>
+            <string>com.example.wifi.payload</string>
+            <key>PayloadType</key>
+            <string>com.apple.wifi.managed</string>
+            <key>SSID_STR</key>
+            <string>Corporate</string>
+        </dict>
+        <dict>
+            <key>PayloadIdentifier</key>
+            <string>com.example.cert.payload</string>
+            <key>PayloadType</key>
+            <string>com.apple.security.root</string>
+        </dict>
+    </array>
+    <key>PayloadDisplayName</key>
+    <string>Wi-Fi</string>
+    <key>PayloadIdentifier</key>
+    <string>com.example.wifi</string>
+    <key>PayloadType</key>
+    <string>Configuration</string>
+</dict>
+</plist>
+"""
+
+
+class ExportIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_path = export_index.get_index_path(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def search(self, *args, **kwargs):
+        index = export_index.open_index(self.index_path)
+        try:
+            return [(object_type, object_id) for object_type, object_id, _, _ in
+                    export_index.search(index, *args, **kwargs)]
+        finally:
+            index.close()
+
+    def test_search_content_and_payload_identifiers(self):
+        export_index.update_index(self.index_path, 'script', [
+            ('1', 'dock', self.write('dock.txt', '/usr/local/bin/dockutil --add'), 'a'),
+            ('2', 'hello', self.write('hello.txt', 'echo hi'), 'b'),
+        ])
+        export_index.update_index(self.index_path, 'profile', [
+            ('7', 'wifi', self.write('wifi.mobileconfig', '<plist/>'), 'c', ['com.example.wifi']),
+        ])
+        self.assertEqual(self.search('"/usr/local/bin/dockutil"'), [('script', 1)])
+        self.assertEqual(self.search(payload_identifier='com.example.wifi'), [('profile', 7)])
+        self.assertEqual(self.search(object_type='script'), [('script', 1), ('script', 2)])
+
+    def test_payload_identifiers_from_mobileconfig(self):
+        payload_identifiers = export_index.get_payload_identifiers(plistlib.readPlistFromString(MOBILECONFIG))
+        self.assertEqual(payload_identifiers,
+                         ['com.example.wifi', 'com.example.wifi.payload', 'com.example.cert.payload'])
+        export_index.update_index(self.index_path, 'profile', [
+            ('7', 'wifi', self.write('wifi.mobileconfig', MOBILECONFIG), 'a', payload_identifiers),
+        ])
+        self.assertEqual(self.search(payload_identifier='com.example.cert.payload'), [('profile', 7)])
+        self.assertEqual(self.search('Corporate'), [('profile', 7)])
+
+    def test_payload_identifiers_of_unparsed_profile(self):
+        self.assertEqual(export_index.get_payload_identifiers(None), [])
+        self.assertEqual(export_index.get_payload_identifiers({'PayloadContent': ['not a payload']}), [])
+
+    def test_changed_content_is_reindexed(self):
+        path = self.write('hello.txt', 'echo hi')
+        export_index.update_index(self.index_path, 'script', [('2', 'hello', path, 'a')])
+        self.write('hello.txt', 'echo bye')
+        export_index.update_index(self.index_path, 'script', [('2', 'hello', path, 'b')])
+        self.assertEqual(self.search('hi'), [])
+        self.assertEqual(self.search('bye'), [('script', 2)])
+
+    def test_deleted_objects_are_pruned_per_type(self):
+        export_index.update_index(self.index_path, 'script', [
+            ('1', 'dock', self.write('dock.txt', 'dockutil'), 'a'),
+            ('2', 'hello', self.write('hello.txt', 'echo hi'), 'b'),
+        ])
+        export_index.update_index(self.index_path, 'profile', [
+            ('7', 'wifi', self.write('wifi.mobileconfig', 'dockutil'), 'c', ['com.example.wifi']),
+        ])
+        export_index.update_index(self.index_path, 'script', [
+            ('2', 'hello', os.path.join(self.directory, 'hello.txt'), 'b'),
+        ])
+        self.assertEqual(self.search('dockutil'), [('profile', 7)])
+        self.assertEqual(self.search(object_type='script'), [('script', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for payload_pool and the workers the download scripts run in it. Run with:
+python -m unittest discover -s jss_common -t .
+"""
+
+import base64
+import hashlib
+import imp
+import os
+import plistlib
+import shutil
+import tempfile
+import time
+import unittest
+
+from jss_common import payload_pool
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+download_all_scripts = imp.load_source(
+    'jss_download_all_scripts', os.path.join(REPOSITORY, 'jss_download_all_scripts', 'jss_download_all_scripts.py'))
+download_all_osx_config_profiles = imp.load_source(
+    'jss_download_all_osx_config_profiles',
+    os.path.join(REPOSITORY, 'jss_download_all_osx_config_profiles', 'jss_download_all_osx_config_profiles.py'))
+
+PROFILE = u"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0"><dict><key>PayloadIdentifier</key><string>com.example.top</string><key>PayloadContent</key>
+<array><dict><key>PayloadIdentifier</key><string>com.example.wifi</string><key>SSID</key><string>café</string></dict>
+</array></dict></plist>"""
+
+
+def double(number, delay=0):
+    time.sleep(delay)
+    return number * 2
+
+
+def fail_or_sleep(number):
+    if number == 0:
+        raise ValueError("bad payload")
+    time.sleep(10)
+
+
+class WriteInPoolTest(unittest.TestCase):
+    def test_yields_results_in_order(self):
+        # The first item is the slowest, results must still come back in the order the items went in
+        items = ((number, (number, 0.2 if number == 0 else 0)) for number in range(10))
+        results = list(payload_pool.write_in_pool(items, double, 2))
+        self.assertEqual(results, [(number, number * 2) for number in range(10)])
+
+    def test_bounds_queued_items(self):
+        consumed = []
+
+        def items():
+            for number in range(20):
+                consumed.append(number)
+                yield number, (number, 0.05)
+
+        for number, _ in payload_pool.write_in_pool(items(), double, 2):
+            # At most processes * 2 items are queued when waiting on the oldest, plus the one just fetched
+            self.assertLessEqual(len(consumed) - number, 2 * 2 + 1)
+
+    def test_worker_exception_is_raised_and_pool_terminated(self):
+        start = time.time()
+        with self.assertRaises(ValueError):
+            list(payload_pool.write_in_pool(((number, (number,)) for number in range(3)), fail_or_sleep, 3))
+        # Terminating the pool stops the sleeping workers rather than waiting for them
+        self.assertLess(time.time() - start, 5)
+
+    def test_fetch_exception_terminates_pool(self):
+        def items():
+            yield 1, (1,)
+            raise IOError("fetch failed")
+
+        start = time.time()
+        with self.assertRaises(IOError):
+            list(payload_pool.write_in_pool(items(), fail_or_sleep, 2))
+        self.assertLess(time.time() - start, 5)
+
+
+class WorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+
+class DecodeAndWriteScriptTest(WorkerTestCase):
+    def test_decodes_and_writes_script(self):
+        script = '#!/bin/sh\n/usr/local/bin/dockutil --add\n'
+        path, content_hash = download_all_scripts.decode_and_write_script(self.directory, 'dock',
+                                                                          base64.b64encode(script))
+        self.assertEqual(path, os.path.join(self.directory, 'dock.txt'))
+        self.assertEqual(self.read(path), script)
+        self.assertEqual(content_hash, hashlib.sha1(script).hexdigest())
+
+
+class NormaliseAndWriteProfileTest(WorkerTestCase):
+    def test_writes_unicode_payload_as_utf8(self):
+        path, content_hash, payload_identifiers = download_all_osx_config_profiles.normalise_and_write_profile(
+            self.directory, 'wifi', PROFILE)
+        self.assertEqual(path, os.path.join(self.directory, 'wifi.mobileconfig'))
+        self.assertEqual(self.read(path), PROFILE.encode('utf-8'))
+        self.assertEqual(content_hash, hashlib.sha1(PROFILE.encode('utf-8')).hexdigest())
+        self.assertEqual(payload_identifiers, ['com.example.top', 'com.example.wifi'])
+
+    def test_pretty_print(self):
+        path, _, _ = download_all_osx_config_profiles.normalise_and_write_profile(self.directory, 'wifi', PROFILE,
+                                                                                  pretty_print=True)
+        written = self.read(path)
+        self.assertNotEqual(written, PROFILE.encode('utf-8'))
+        self.assertIn('\t<key>PayloadIdentifier</key>\n', written)
+        self.assertEqual(plistlib.readPlistFromString(written),
+                         plistlib.readPlistFromString(PROFILE.encode('utf-8')))
+
+    def test_unparseable_payload_is_written_as_is(self):
+        path, _, payload_identifiers = download_all_osx_config_profiles.normalise_and_write_profile(
+            self.directory, 'broken', 'not a plist', pretty_print=True)
+        self.assertEqual(self.read(path), 'not a plist')
+        self.assertEqual(payload_identifiers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Tests for response_cache against a local stand-in JSS. Run with: python -m unittest discover -s jss_common
+"""
+
+import BaseHTTPServer
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urllib2
+
+from jss_common import response_cache
+
+
+class StandInJSS(BaseHTTPServer.BaseHTTPRequestHandler):
+    # path: (body, etag)
+    objects = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body, etag = self.objects[self.path]
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInJSS)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, 'cache')
+        StandInJSS.objects = {}
+        del StandInJSS.requests[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, cache, path):
+        return cache.read(urllib2.Request('http://127.0.0.1:{}{}'.format(self.server.server_port, path)))
+
+    def test_revalidates_responses_with_an_etag(self):
+        StandInJSS.objects['/scripts/id/1'] = ('<script/>', '"1"')
+        cache = response_cache.ResponseCache(self.cache_path, 300, 1024)
+        self.assertEqual(self.read(cache, '/scripts/id/1'), '<script/>')
+        self.assertEqual(self.read(cache, '/scripts/id/1'), '<script/>')
+        self.assertEqual(StandInJSS.requests, [('/scripts/id/1', None), ('/scripts/id/1', '"1"')])
+        self.assertEqual(cache.stats, {'hits': 0, 'revalidated': 1, 'misses': 1})
+        StandInJSS.objects['/scripts/id/1'] = ('<script>changed</script>', '"2"')
+        self.assertEqual(self.read(cache, '/scripts/id/1'), '<script>changed</script>')
+
+    def test_reuses_responses_without_validators_until_they_expire(self):
+        StandInJSS.objects['/scripts'] = ('<scripts/>', None)
+        cache = response_cache.ResponseCache(self.cache_path, 300, 1024)
+        self.read(cache, '/scripts')
+        self.assertEqual(self.read(cache, '/scripts'), '<scripts/>')
+        self.assertEqual(len(StandInJSS.requests), 1)
+        cache.ttl = 0
+        self.read(cache, '/scripts')
+        self.assertEqual(len(StandInJSS.requests), 2)
+
+    def test_skips_a_directory_others_can_access(self):
+        os.mkdir(self.cache_path)
+        os.chmod(self.cache_path, 0777)
+        StandInJSS.objects['/scripts'] = ('<scripts/>', None)
+        cache = response_cache.ResponseCache(self.cache_path, 300, 1024)
+        self.read(cache, '/scripts')
+        self.read(cache, '/scripts')
+        self.assertEqual(len(StandInJSS.requests), 2)
+        self.assertEqual(os.listdir(self.cache_path), [])
+
+    def test_evicts_least_recently_used(self):
+        for path in ('/a', '/b', '/c'):
+            StandInJSS.objects[path] = ('x' * 400, None)
+        cache = response_cache.ResponseCache(self.cache_path, 300, 1000)
+        for age, path in enumerate(('/a', '/b', '/c')):
+            self.read(cache, path)
+            url = 'http://127.0.0.1:{}{}'.format(self.server.server_port, path)
+            entry_time = time.time() - 100 + age
+            os.utime(os.path.join(self.cache_path, hashlib.sha1(url).hexdigest()), (entry_time, entry_time))
+        # Reading /a again makes it the most recently used
+        self.read(cache, '/a')
+        cache.evict()
+        del StandInJSS.requests[:]
+        for path in ('/a', '/b', '/c'):
+            self.read(cache, path)
+        self.assertEqual([path for path, _ in StandInJSS.requests], ['/b'])
+
+
+class EvictedWhileReadingTest(ResponseCacheTest):
+    """
+    Another download script sharing the cache can evict an entry between reading its metadata and its body.
+    """
+    def setUp(self):
+        ResponseCacheTest.setUp(self)
+        self.original_read_entry_metadata = response_cache.read_entry_metadata
+
+        def read_entry_metadata_then_evict(entry_path):
+            metadata = self.original_read_entry_metadata(entry_path)
+            if metadata:
+                os.remove(entry_path)
+            return metadata
+
+        self.read_entry_metadata_then_evict = read_entry_metadata_then_evict
+
+    def tearDown(self):
+        response_cache.read_entry_metadata = self.original_read_entry_metadata
+        ResponseCacheTest.tearDown(self)
+
+    def test_not_modified_falls_back_to_unconditional_fetch(self):
+        StandInJSS.objects['/scripts/id/1'] = ('<script/>', '"1"')
+        cache = response_cache.ResponseCache(self.cache_path, 300, 1024)
+        self.read(cache, '/scripts/id/1')
+        response_cache.read_entry_metadata = self.read_entry_metadata_then_evict
+        self.assertEqual(self.read(cache, '/scripts/id/1'), '<script/>')
+        self.assertEqual([etag for _, etag in StandInJSS.requests], [None, '"1"', None])
+        self.assertEqual(cache.stats, {'hits': 0, 'revalidated': 0, 'misses': 2})
+
+    def test_ttl_hit_falls_back_to_fetch(self):
+        StandInJSS.objects['/scripts'] = ('<scripts/>', None)
+        cache = response_cache.ResponseCache(self.cache_path, 300, 1024)
+        self.read(cache, '/scripts')
+        response_cache.read_entry_metadata = self.read_entry_metadata_then_evict
+        self.assertEqual(self.read(cache, '/scripts'), '<scripts/>')
+        self.assertEqual(len(StandInJSS.requests), 2)
+        self.assertEqual(cache.stats, {'hits': 0, 'revalidated': 0, 'misses': 2})
+
+    def test_evict_skips_entries_that_disappear(self):
+        StandInJSS.objects['/scripts'] = ('x' * 400, None)
+        cache = response_cache.ResponseCache(self.cache_path, 300, 0)
+        self.read(cache, '/scripts')
+        original_listdir = response_cache.os.listdir
+        response_cache.os.listdir = lambda path: original_listdir(path) + ['evicted-by-another-script']
+        try:
+            cache.evict()
+        finally:
+            response_cache.os.listdir = original_listdir
+        self.assertEqual(os.listdir(self.cache_path), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,22 +20,36 @@ This script will grab all the eas that exist on the JSS. Customize to your envir
 in the main function.
 """
 
-import subprocess
 import os
+import sys
 from datetime import datetime
 import urllib2
 import httplib
 import socket
 import ssl
 import base64
+import hashlib
 import xml.etree.ElementTree as ET
 
+# The helpers shared by the JSS scripts live in jss_common at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jss_common import export_index, response_cache
+
 #Global variables
 #Change these to set their values for your environment
 JSS_URL = 'https://jss.mycompany.com:8443'
 API_USER = 'api_user'
 API_PASS = 'api_password'
 WRITE_PATH = '/tmp/'
+# SQLite full text index of everything exported, updated on every run (see jss_search_export_index)
+INDEX_PATH = export_index.get_index_path(WRITE_PATH)
+# JSS responses are cached here between runs. Responses without an ETag or Last-Modified header are reused for up to
+# CACHE_TTL seconds, and the least recently used ones are removed once the cache grows past CACHE_MAX_SIZE bytes. The
+# cache is skipped if CACHE_PATH is accessible to anyone but the user running the script
+CACHE_PATH = os.path.join(WRITE_PATH, 'jss_response_cache')
+CACHE_TTL = 300
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+RESPONSE_CACHE = response_cache.ResponseCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_SIZE)
 
 
 class TLS1Connection(httplib.HTTPSConnection):
@@ -71,9 +85,9 @@ def get_scripts(jss_url, api_user, api_pass):
     """
     jss_request = urllib2.Request(jss_url + '/JSSResource/computerextensionattributes')
     jss_request.add_header('Authorization', 'Basic ' + base64.b64encode(api_user + ':' + api_pass))
-    request_response = urllib2.urlopen(jss_request)
-    if request_response.code == 200:
-        return ET.fromstring(request_response.read())
+    response_body = RESPONSE_CACHE.read(jss_request)
+    if response_body is not None:
+        return ET.fromstring(response_body)
         
 def write_scripts(jss_url, api_user, api_pass, write_path, scripts):
     """
@@ -84,6 +98,7 @@ def write_scripts(jss_url, api_user, api_pass, write_path, scripts):
     final_write_path = os.path.join(write_path, "JSS_EAS_{}".format(time))
     if not os.path.exists(final_write_path):
         os.mkdir(final_write_path)
+    written = []
     for script in scripts.findall('computerextensionattributes/id'):
         script_data = get_individual_script(jss_url, api_user, api_pass, script.text)
         #Strip out any characters in script name which may cause issues when saving
@@ -93,19 +108,23 @@ def write_scripts(jss_url, api_user, api_pass, write_path, scripts):
         print "Writing {}".format(script_name)
         write_file(final_write_path, script_name, script_text)
         print "Wrote {}".format(final_write_path + '/' + script_name + '.txt')
-
+        written.append((script.text, script_name, os.path.join(final_write_path, script_name + '.txt'),
+                        hashlib.sha1(script_text).hexdigest()))
+    # Index once everything is fetched so the index isn't locked for the length of the export
+    export_index.update_index(INDEX_PATH, 'extension_attribute', written)
         
         
         
+
 def get_individual_script(jss_url, api_user, api_pass, script):
     """
     Get script object from the JSS.
     """
     jss_request = urllib2.Request(jss_url + '/JSSResource/computerextensionattributes/id/' + script)
     jss_request.add_header('Authorization', 'Basic ' + base64.b64encode(api_user + ':' + api_pass))
-    request_response = urllib2.urlopen(jss_request)
-    if request_response.code == 200:
-        return ET.fromstring(request_response.read())
+    response_body = RESPONSE_CACHE.read(jss_request)
+    if response_body is not None:
+        return ET.fromstring(response_body)
         
 def build_time():
     """
@@ -127,6 +146,8 @@ def main():
     urllib2.install_opener(urllib2.build_opener(TLS1Handler()))
     scripts = get_scripts(JSS_URL, API_USER, API_PASS)
     write_scripts(JSS_URL, API_USER, API_PASS, WRITE_PATH, scripts)
+    RESPONSE_CACHE.evict()
+    print "Response cache: {hits} hits, {revalidated} revalidated, {misses} misses".format(**RESPONSE_CACHE.stats)
 
     
 if __name__ == "__main__":
@@ -21,20 +21,41 @@ the global variables.
 """
 
 import os
+import sys
 from datetime import datetime
 import urllib2
 import httplib
 import socket
 import ssl
 import base64
+import hashlib
+import plistlib
 import xml.etree.ElementTree as ET
 
+# The helpers shared by the JSS scripts live in jss_common at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jss_common import export_index, payload_pool, response_cache
+
 # Global variables
 # Change these to set their values for your environment
 JSS_URL = 'https://jss.mycompany.com:8443'
 API_USER = 'api_user'
 API_PASS = 'api_password'
 WRITE_PATH = '/tmp/'
+# Number of processes normalising and writing profiles while the next ones are fetched, None uses one per CPU core
+DECODE_PROCESSES = None
+# Set to True to rewrite each profile as a consistently indented plist instead of the payload exactly as the JSS
+# stores it
+PRETTY_PRINT = False
+# SQLite full text index of everything exported, updated on every run (see jss_search_export_index)
+INDEX_PATH = export_index.get_index_path(WRITE_PATH)
+# JSS responses are cached here between runs. Responses without an ETag or Last-Modified header are reused for up to
+# CACHE_TTL seconds, and the least recently used ones are removed once the cache grows past CACHE_MAX_SIZE bytes. The
+# cache is skipped if CACHE_PATH is accessible to anyone but the user running the script
+CACHE_PATH = os.path.join(WRITE_PATH, 'jss_response_cache')
+CACHE_TTL = 300
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+RESPONSE_CACHE = response_cache.ResponseCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_SIZE)
 
 
 class TLS1Connection(httplib.HTTPSConnection):
@@ -73,28 +94,61 @@ def get_osx_configuration_profiles(jss_url, api_user, api_pass):
     """
     jss_request = urllib2.Request(jss_url + '/JSSResource/osxconfigurationprofiles')
     jss_request.add_header('Authorization', 'Basic ' + base64.b64encode(api_user + ':' + api_pass))
-    request_response = urllib2.urlopen(jss_request)
-    if request_response.code == 200:
-        return ET.fromstring(request_response.read())
+    response_body = RESPONSE_CACHE.read(jss_request)
+    if response_body is not None:
+        return ET.fromstring(response_body)
 
 
 def write_osx_configuration_profiles(jss_url, api_user, api_pass, write_path, osx_configuration_profiles):
     """
     Iterate over list of OSX Configuration Profiles to get data from the JSS on each individual profile and write them
-    to a file.
+    to a file. Normalising and writing happens in a pool of processes so fetching isn't held up by large profiles.
     """
     time = build_time()
     final_write_path = os.path.join(write_path, "JSS_OSXConfigurationProfiles_{}".format(time))
     if not os.path.exists(final_write_path):
         os.mkdir(final_write_path)
+    written = []
+    for (profile_id, profile_name), (profile_path, content_hash, payload_identifiers) in payload_pool.write_in_pool(
+            fetch_profiles(jss_url, api_user, api_pass, final_write_path, osx_configuration_profiles),
+            normalise_and_write_profile, DECODE_PROCESSES):
+        print "Wrote {}".format(profile_path)
+        written.append((profile_id, profile_name, profile_path, content_hash, payload_identifiers))
+    export_index.update_index(INDEX_PATH, 'profile', written)
+
+
+def fetch_profiles(jss_url, api_user, api_pass, write_path, osx_configuration_profiles):
+    """
+    Get each profile from the JSS in turn, yielding its id and name with the arguments for normalise_and_write_profile.
+    """
     for profile in osx_configuration_profiles.findall('os_x_configuration_profile/id'):
         profile_data = get_individual_profile(jss_url, api_user, api_pass, profile.text)
         # Strip out any characters in profile name which may cause issues when saving
         profile_name = profile_data.find('general/name').text.translate(None, "\!?/:")
-        profile_text = profile_data.find('general/payloads').text
         print "Writing {}".format(profile_name)
-        write_file(final_write_path, profile_name, profile_text)
-        print "Wrote {}".format(final_write_path + '/' + profile_name + '.mobileconfig')
+        yield ((profile.text, profile_name),
+               (write_path, profile_name, profile_data.find('general/payloads').text, PRETTY_PRINT))
+
+
+def normalise_and_write_profile(path, name, profile_text, pretty_print=False):
+    """
+    Encode a profile payload as UTF-8, optionally pretty print it, and write it to a file. Runs in a pool process and
+    returns the path written to, the hash of the profile and the payload identifiers found in it.
+    """
+    # ElementTree has already unescaped the payload XML, but hands it back as unicode if it has non-ASCII characters
+    if isinstance(profile_text, unicode):
+        profile_text = profile_text.encode('utf-8')
+    try:
+        profile = plistlib.readPlistFromString(profile_text)
+    except Exception as e:
+        # Write payloads plistlib can't read as they are, they just won't be pretty printed or have identifiers indexed
+        print "Couldn't parse {}: {}".format(name, e)
+        profile = None
+    if profile is not None and pretty_print:
+        profile_text = plistlib.writePlistToString(profile)
+    write_file(path, name, profile_text)
+    return (os.path.join(path, name + '.mobileconfig'), hashlib.sha1(profile_text).hexdigest(),
+            export_index.get_payload_identifiers(profile))
 
 
 def get_individual_profile(jss_url, api_user, api_pass, profile):
@@ -103,9 +157,9 @@ def get_individual_profile(jss_url, api_user, api_pass, profile):
     """
     jss_request = urllib2.Request(jss_url + '/JSSResource/osxconfigurationprofiles/id/' + profile)
     jss_request.add_header('Authorization', 'Basic ' + base64.b64encode(api_user + ':' + api_pass))
-    request_response = urllib2.urlopen(jss_request)
-    if request_response.code == 200:
-        return ET.fromstring(request_response.read())
+    response_body = RESPONSE_CACHE.read(jss_request)
+    if response_body is not None:
+        return ET.fromstring(response_body)
 
 
 def build_time():
@@ -130,6 +184,8 @@ def main():
     urllib2.install_opener(urllib2.build_opener(TLS1Handler()))
     osx_configuration_profiles = get_osx_configuration_profiles(JSS_URL, API_USER, API_PASS)
     write_osx_configuration_profiles(JSS_URL, API_USER, API_PASS, WRITE_PATH, osx_configuration_profiles)
+    RESPONSE_CACHE.evict()
+    print "Response cache: {hits} hits, {revalidated} revalidated, {misses} misses".format(**RESPONSE_CACHE.stats)
 
 
 if __name__ == "__main__":
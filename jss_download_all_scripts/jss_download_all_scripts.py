@@ -20,22 +20,38 @@ This script will grab all the scripts that exist on the JSS. Customize to your e
 in the main function.
 """
 
-import subprocess
 import os
+import sys
 from datetime import datetime
 import urllib2
 import httplib
 import socket
 import ssl
 import base64
+import hashlib
 import xml.etree.ElementTree as ET
 
+# The helpers shared by the JSS scripts live in jss_common at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jss_common import export_index, payload_pool, response_cache
+
 #Global variables
 #Change these to set their values for your environment
 JSS_URL = 'https://jss.mycompany.com:8443'
 API_USER = 'api_user'
 API_PASS = 'api_password'
 WRITE_PATH = '/tmp/'
+# Number of processes decoding and writing scripts while the next ones are fetched, None uses one per CPU core
+DECODE_PROCESSES = None
+# SQLite full text index of everything exported, updated on every run (see jss_search_export_index)
+INDEX_PATH = export_index.get_index_path(WRITE_PATH)
+# JSS responses are cached here between runs. Responses without an ETag or Last-Modified header are reused for up to
+# CACHE_TTL seconds, and the least recently used ones are removed once the cache grows past CACHE_MAX_SIZE bytes. The
+# cache is skipped if CACHE_PATH is accessible to anyone but the user running the script
+CACHE_PATH = os.path.join(WRITE_PATH, 'jss_response_cache')
+CACHE_TTL = 300
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+RESPONSE_CACHE = response_cache.ResponseCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_SIZE)
 
 
 class TLS1Connection(httplib.HTTPSConnection):
@@ -71,41 +87,59 @@ def get_scripts(jss_url, api_user, api_pass):
     """
     jss_request = urllib2.Request(jss_url + '/JSSResource/scripts')
     jss_request.add_header('Authorization', 'Basic ' + base64.b64encode(api_user + ':' + api_pass))
-    request_response = urllib2.urlopen(jss_request)
-    if request_response.code == 200:
-        return ET.fromstring(request_response.read())
+    response_body = RESPONSE_CACHE.read(jss_request)
+    if response_body is not None:
+        return ET.fromstring(response_body)
         
 def write_scripts(jss_url, api_user, api_pass, write_path, scripts):
     """
     Iterate over list of scripts to get data from the JSS on each individual script and write them
-    to a file.
+    to a file. Decoding and writing happens in a pool of processes so fetching isn't held up by large scripts.
     """
     time = build_time()
     final_write_path = os.path.join(write_path, "JSS_Scripts_{}".format(time))
     if not os.path.exists(final_write_path):
         os.mkdir(final_write_path)
+    written = []
+    for (script_id, script_name), (script_path, content_hash) in payload_pool.write_in_pool(
+            fetch_scripts(jss_url, api_user, api_pass, final_write_path, scripts), decode_and_write_script,
+            DECODE_PROCESSES):
+        print "Wrote {}".format(script_path)
+        written.append((script_id, script_name, script_path, content_hash))
+    export_index.update_index(INDEX_PATH, 'script', written)
+
+
+def fetch_scripts(jss_url, api_user, api_pass, write_path, scripts):
+    """
+    Get each script from the JSS in turn, yielding its id and name with the arguments for decode_and_write_script.
+    """
     for script in scripts.findall('script/id'):
         script_data = get_individual_script(jss_url, api_user, api_pass, script.text)
         #Strip out any characters in script name which may cause issues when saving
         script_name = script_data.find('name').text.translate(None, "\!?/:")
-        #Use the base64 encoded version of the script and decode it
-        script_text = base64.b64decode(script_data.find('script_contents_encoded').text)
         print "Writing {}".format(script_name)
-        write_file(final_write_path, script_name, script_text)
-        print "Wrote {}".format(final_write_path + '/' + script_name + '.txt')
+        yield (script.text, script_name), (write_path, script_name, script_data.find('script_contents_encoded').text)
+
+
+def decode_and_write_script(path, name, encoded_text):
+    """
+    Decode the base64 encoded version of a script and write it to a file. Runs in a pool process and returns the path
+    written to and the hash of the script.
+    """
+    script_text = base64.b64decode(encoded_text)
+    write_file(path, name, script_text)
+    return os.path.join(path, name + '.txt'), hashlib.sha1(script_text).hexdigest()
+
 
-        
-        
-        
 def get_individual_script(jss_url, api_user, api_pass, script):
     """
     Get script object from the JSS.
     """
     jss_request = urllib2.Request(jss_url + '/JSSResource/scripts/id/' + script)
     jss_request.add_header('Authorization', 'Basic ' + base64.b64encode(api_user + ':' + api_pass))
-    request_response = urllib2.urlopen(jss_request)
-    if request_response.code == 200:
-        return ET.fromstring(request_response.read())
+    response_body = RESPONSE_CACHE.read(jss_request)
+    if response_body is not None:
+        return ET.fromstring(response_body)
         
 def build_time():
     """
@@ -127,6 +161,8 @@ def main():
     urllib2.install_opener(urllib2.build_opener(TLS1Handler()))
     scripts = get_scripts(JSS_URL, API_USER, API_PASS)
     write_scripts(JSS_URL, API_USER, API_PASS, WRITE_PATH, scripts)
+    RESPONSE_CACHE.evict()
+    print "Response cache: {hits} hits, {revalidated} revalidated, {misses} misses".format(**RESPONSE_CACHE.stats)
 
     
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# Copyright (C) 2015 Christopher Collins
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import argparse
+import os
+import sqlite3
+import sys
+
+# The helpers shared by the JSS scripts live in jss_common at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jss_common import export_index
+
+"""
+Searches the index built by the JSS download scripts for exported scripts, extension attributes and configuration
+profiles by their content, name or payload identifiers.
+"""
+
+# Global variables
+# Set WRITE_PATH to the same value as in the download scripts
+WRITE_PATH = '/tmp/'
+INDEX_PATH = export_index.get_index_path(WRITE_PATH)
+
+
+def arguments():
+    parser = argparse.ArgumentParser(description='Search the index of exported JSS scripts, EAs and profiles')
+    parser.add_argument('query', nargs='*', help='words or phrases to search the content and names for')
+    parser.add_argument('-i', '--index', help='path to the index database', default=INDEX_PATH)
+    parser.add_argument('-t', '--type', help='only return objects of this type',
+                        choices=['script', 'extension_attribute', 'profile'])
+    parser.add_argument('--payload-identifier', help='only return profiles containing this payload identifier')
+    return parser.parse_args()
+
+
+def main():
+    args = arguments()
+    if not os.path.exists(args.index):
+        print("No index found at {}, run one of the download scripts first.".format(args.index))
+        sys.exit(1)
+    index = export_index.open_index(args.index)
+    try:
+        results = export_index.search(index, ' '.join(args.query), args.type, args.payload_identifier)
+    except sqlite3.OperationalError as e:
+        print("Invalid search: %s" % e)
+        sys.exit(1)
+    for object_type, object_id, name, path in results:
+        print("{}\t{}\t{}\t{}".format(object_type, object_id, name, path))
+
+
+if __name__ == '__main__':
+    main()